@@ -4,19 +4,55 @@ Test script for YubiApp Locations API endpoints
 Uses YubiKey authentication for all operations
 """
 
+import argparse
 import requests
 import json
 import getpass
 import sys
-from typing import Optional, Dict, Any
+from types import MappingProxyType
+from typing import Optional, Dict, Any, Mapping
+
+_TIMEOUT = (3.05, 30)  # (connect, read) seconds
+_REFRESH_TIMEOUT = (3.05, 60)
+
+_LOCATION_TYPE_MAP = MappingProxyType({"1": "office", "2": "home", "3": "event", "4": "other"})
+_LOCATION_TYPE_MENU = "Location type options:\n  1. office\n  2. home\n  3. event\n  4. other"
+
+_PARSER = argparse.ArgumentParser(
+    description="YubiApp Locations API Test Script",
+    formatter_class=argparse.RawDescriptionHelpFormatter,
+    epilog="""examples:
+  python3 test_locations_api.py
+  python3 test_locations_api.py http://your-server:8080/api/v1
+
+prerequisites:
+  - YubiApp API server running
+  - YubiKey configured and registered
+  - Python requests library installed""",
+)
+_PARSER.add_argument("base_url", nargs="?", default="http://localhost:8080/api/v1",
+                     help="API base URL (default: %(default)s)")
+_PARSER.add_argument("--verify-via-list", action="store_true",
+                     help="re-list locations after each write instead of checking the write responses")
 
 class YubiAppLocationTester:
+    __slots__ = ("base_url", "_session_token", "_session_auth_headers", "session_id", "refresh_token",
+                 "user_info", "http", "_envelope_key")
+
     def __init__(self, base_url: str = "http://localhost:8080/api/v1"):
         self.base_url = base_url
         self.session_token = None
         self.session_id = None
         self.refresh_token = None
         self.user_info = None
+        self._envelope_key: Optional[str] = None
+        
+        # Pooled keep-alive session shared by every API call
+        self.http = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=10, pool_maxsize=10)
+        self.http.mount("http://", adapter)
+        self.http.mount("https://", adapter)
+        self.http.headers["Content-Type"] = "application/json"
         
     def get_yubikey_otp(self, operation: str) -> str:
         """Prompt user for YubiKey OTP"""
@@ -37,7 +73,7 @@ class YubiAppLocationTester:
         }
         
         print(f"🔐 Authenticating with YubiKey...")
-        response = requests.post(url, json=data)
+        response = self.http.post(url, json=data, timeout=_TIMEOUT)
         
         if response.status_code != 200:
             print(f"❌ Authentication failed: {response.status_code}")
@@ -60,7 +96,7 @@ class YubiAppLocationTester:
         }
         
         print(f"🔐 Creating session...")
-        response = requests.post(url, json=data)
+        response = self.http.post(url, json=data, timeout=_TIMEOUT)
         
         if response.status_code != 200:
             print(f"❌ Session creation failed: {response.status_code}")
@@ -84,10 +120,9 @@ class YubiAppLocationTester:
         
         # Send refresh token in JSON body
         data = {"refresh_token": self.refresh_token} if self.refresh_token else {}
-        headers = {"Content-Type": "application/json"}
         
         print(f"🔄 Refreshing session...")
-        response = requests.post(url, json=data, headers=headers)
+        response = self.http.post(url, json=data, timeout=_REFRESH_TIMEOUT)
         
         if response.status_code != 200:
             print(f"❌ Session refresh failed: {response.status_code}")
@@ -108,30 +143,63 @@ class YubiAppLocationTester:
         print(f"✅ Session refreshed successfully")
         return session_token
     
-    def get_auth_headers(self, use_session: bool = True, yubikey_otp: str = None) -> Dict[str, str]:
+    @property
+    def session_token(self) -> Optional[str]:
+        return self._session_token
+
+    @session_token.setter
+    def session_token(self, token: Optional[str]):
+        # Build the Bearer header once per token rather than on every call
+        self._session_token = token
+        self._session_auth_headers = MappingProxyType({"Authorization": f"Bearer {token}"} if token else {})
+
+    def get_auth_headers(self, use_session: bool = True, yubikey_otp: str = None) -> Mapping[str, str]:
         """Get authentication headers"""
-        if use_session and self.session_token:
-            return {"Authorization": f"Bearer {self.session_token}"}
+        if use_session and self._session_token:
+            return self._session_auth_headers
         elif yubikey_otp:
             return {"Authorization": f"yubikey:{yubikey_otp}"}
         else:
             return {}
     
+    def _unwrap(self, result: Dict[str, Any]) -> Dict[str, Any]:
+        """Return the item inside a single-item response envelope"""
+        key = self._envelope_key
+        if key is not None:
+            return result.get(key, result)
+        # Remember whichever envelope the server uses the first time we see it
+        for candidate in ('data', 'item'):
+            if candidate in result:
+                self._envelope_key = candidate
+                return result[candidate]
+        return result
+    
     def list_locations(self) -> Dict[str, Any]:
         """List all locations"""
         url = f"{self.base_url}/locations"
         headers = self.get_auth_headers()
         
         print(f"\n📋 Listing locations...")
-        response = requests.get(url, headers=headers)
+        response = self.http.get(url, headers=headers, timeout=_TIMEOUT)
         
-        if response.status_code == 401 and "count mismatch" in response.text:
+        # Decode a failed response once and match on the API's "error" field
+        error = ""
+        if response.status_code != 200:
+            try:
+                body = response.json()
+            except ValueError:
+                body = None
+            error = body.get("error") if isinstance(body, dict) else None
+            if not isinstance(error, str) or not error:
+                error = response.text
+        
+        if response.status_code == 401 and "count mismatch" in error:
             print(f"⚠️  Session token expired (count mismatch), refreshing...")
             new_token = self.refresh_session(self.session_id)
             if new_token:
                 self.session_token = new_token
                 headers = self.get_auth_headers()
-                response = requests.get(url, headers=headers)
+                response = self.http.get(url, headers=headers, timeout=_TIMEOUT)
                 if response.status_code != 200:
                     print(f"❌ Failed to list locations after refresh: {response.status_code}")
                     print(f"   Response: {response.text}")
@@ -141,21 +209,24 @@ class YubiAppLocationTester:
                 return {}
         elif response.status_code != 200:
             print(f"❌ Failed to list locations: {response.status_code}")
-            print(f"   Response: {response.text}")
+            print(f"   Response: {error}")
             return {}
         
         result = response.json()
         # Handle different response structures
         locations = result.get('data', result.get('items', []))
-        print(f"✅ Found {len(locations)} location(s)")
-        
+        lines = [f"✅ Found {len(locations)} location(s)\n"]
+
         for i, location in enumerate(locations, 1):
-            print(f"   {i}. {location['name']} ({location['id']})")
-            print(f"      Type: {location['type']}, Active: {location['active']}")
-            print(f"      Address: {location['address']}")
-            print(f"      Description: {location['description']}")
-            print()
-        
+            lines.append(
+                f"   {i}. {location['name']} ({location['id']})\n"
+                f"      Type: {location['type']}, Active: {location['active']}\n"
+                f"      Address: {location['address']}\n"
+                f"      Description: {location['description']}\n"
+                "\n"
+            )
+
+        sys.stdout.write("".join(lines))
         return result
     
     def create_location(self, otp: str) -> Dict[str, Any]:
@@ -173,15 +244,9 @@ class YubiAppLocationTester:
         description = input("Description (optional): ").strip()
         address = input("Address (optional): ").strip()
         
-        print("Location type options:")
-        print("  1. office")
-        print("  2. home") 
-        print("  3. event")
-        print("  4. other")
+        print(_LOCATION_TYPE_MENU)
         type_choice = input("Choose type (1-4, default=1): ").strip()
-        
-        type_map = {"1": "office", "2": "home", "3": "event", "4": "other"}
-        location_type = type_map.get(type_choice, "office")
+        location_type = _LOCATION_TYPE_MAP.get(type_choice, "office")
         
         active = input("Active (y/n, default=y): ").strip().lower() != "n"
         
@@ -194,7 +259,7 @@ class YubiAppLocationTester:
         }
         
         print(f"🔐 Creating location with YubiKey authentication...")
-        response = requests.post(url, json=data, headers=headers)
+        response = self.http.post(url, json=data, headers=headers, timeout=_TIMEOUT)
         
         if response.status_code != 201:
             print(f"❌ Failed to create location: {response.status_code}")
@@ -204,14 +269,7 @@ class YubiAppLocationTester:
         result = response.json()
         print(f"✅ Location created successfully")
         
-        # Handle different possible response structures
-        if 'data' in result:
-            location = result['data']
-        elif 'item' in result:
-            location = result['item']
-        else:
-            location = result
-            
+        location = self._unwrap(result)
         if 'id' in location:
             print(f"   ID: {location['id']}")
         if 'name' in location:
@@ -235,15 +293,9 @@ class YubiAppLocationTester:
         description = input("New description (leave empty to keep current): ").strip()
         address = input("New address (leave empty to keep current): ").strip()
         
-        print("Location type options:")
-        print("  1. office")
-        print("  2. home") 
-        print("  3. event")
-        print("  4. other")
+        print(_LOCATION_TYPE_MENU)
         type_choice = input("New type (1-4, leave empty to keep current): ").strip()
-        
-        type_map = {"1": "office", "2": "home", "3": "event", "4": "other"}
-        location_type = type_map.get(type_choice) if type_choice else None
+        location_type = _LOCATION_TYPE_MAP.get(type_choice) if type_choice else None
         
         active_choice = input("Active (y/n, leave empty to keep current): ").strip().lower()
         active = None if not active_choice else (active_choice == "y")
@@ -266,7 +318,7 @@ class YubiAppLocationTester:
             return {}
         
         print(f"🔐 Updating location with YubiKey authentication...")
-        response = requests.put(url, json=data, headers=headers)
+        response = self.http.put(url, json=data, headers=headers, timeout=_TIMEOUT)
         
         if response.status_code != 200:
             print(f"❌ Failed to update location: {response.status_code}")
@@ -276,14 +328,7 @@ class YubiAppLocationTester:
         result = response.json()
         print(f"✅ Location updated successfully")
         
-        # Handle different possible response structures
-        if 'data' in result:
-            location = result['data']
-        elif 'item' in result:
-            location = result['item']
-        else:
-            location = result
-            
+        location = self._unwrap(result)
         if 'id' in location:
             print(f"   ID: {location['id']}")
         if 'name' in location:
@@ -309,7 +354,7 @@ class YubiAppLocationTester:
             return False
         
         print(f"🔐 Deleting location with YubiKey authentication...")
-        response = requests.delete(url, headers=headers)
+        response = self.http.delete(url, headers=headers, timeout=_TIMEOUT)
         
         if response.status_code not in [200, 204]:
             print(f"❌ Failed to delete location: {response.status_code}")
@@ -319,8 +364,12 @@ class YubiAppLocationTester:
         print(f"✅ Location deleted successfully (marked as inactive)")
         return True
     
-    def run_tests(self):
-        """Run the complete test suite"""
+    def run_tests(self, verify_via_list: bool = False):
+        """Run the complete test suite
+
+        Create/update/delete are verified from their own responses unless
+        verify_via_list is set, in which case the locations are re-listed.
+        """
         print("🚀 YubiApp Locations API Test Suite")
         print("=" * 50)
         
@@ -349,20 +398,17 @@ class YubiAppLocationTester:
             return
         
         # Extract location ID from response
-        if 'data' in create_result and 'id' in create_result['data']:
-            location_id = create_result['data']['id']
-        elif 'item' in create_result and 'id' in create_result['item']:
-            location_id = create_result['item']['id']
-        elif 'id' in create_result:
-            location_id = create_result['id']
-        else:
+        location_id = self._unwrap(create_result).get('id')
+        if not location_id:
             print("❌ Could not find location ID in response, stopping tests")
             print(f"   Response: {create_result}")
             return
         
-        # List locations again to see the new one
         print("\n5️⃣  Verifying Create Operation")
-        self.list_locations()
+        if verify_via_list:
+            self.list_locations()
+        else:
+            print(f"✅ Create confirmed by response (ID: {location_id})")
         
         # Update location (write operation)
         print("\n6️⃣  Testing Update Operation")
@@ -373,9 +419,16 @@ class YubiAppLocationTester:
             print("❌ Update operation failed, stopping tests")
             return
         
-        # List locations again to see the changes
         print("\n7️⃣  Verifying Update Operation")
-        self.list_locations()
+        if verify_via_list:
+            self.list_locations()
+        else:
+            updated = self._unwrap(update_result)
+            if updated.get('id') != location_id:
+                print("❌ Update response does not match the created location, stopping tests")
+                print(f"   Response: {update_result}")
+                return
+            print(f"✅ Update confirmed by response (ID: {location_id})")
         
         # Delete location (write operation)
         print("\n8️⃣  Testing Delete Operation")
@@ -386,44 +439,22 @@ class YubiAppLocationTester:
             print("❌ Delete operation failed, stopping tests")
             return
         
-        # List locations again to see the deletion
         print("\n9️⃣  Verifying Delete Operation")
-        self.list_locations()
+        if verify_via_list:
+            self.list_locations()
+        else:
+            print(f"✅ Delete confirmed by response (ID: {location_id})")
         
         print("\n🎉 All tests completed successfully!")
         print("=" * 50)
 
 def main():
     """Main function"""
-    # Check for help flag
-    if len(sys.argv) > 1 and sys.argv[1] in ['--help', '-h', 'help']:
-        print("YubiApp Locations API Test Script")
-        print("=" * 40)
-        print("Usage:")
-        print("  python3 test_locations_api.py [base_url]")
-        print("")
-        print("Arguments:")
-        print("  base_url    API base URL (default: http://localhost:8080/api/v1)")
-        print("")
-        print("Examples:")
-        print("  python3 test_locations_api.py")
-        print("  python3 test_locations_api.py http://your-server:8080/api/v1")
-        print("")
-        print("Prerequisites:")
-        print("  - YubiApp API server running")
-        print("  - YubiKey configured and registered")
-        print("  - Python requests library installed")
-        return
-    
-    if len(sys.argv) > 1:
-        base_url = sys.argv[1]
-    else:
-        base_url = "http://localhost:8080/api/v1"
-    
-    tester = YubiAppLocationTester(base_url)
+    args = _PARSER.parse_args()
+    tester = YubiAppLocationTester(args.base_url)
     
     try:
-        tester.run_tests()
+        tester.run_tests(verify_via_list=args.verify_via_list)
     except KeyboardInterrupt:
         print("\n\n❌ Test interrupted by user")
         sys.exit(1)